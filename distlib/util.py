@@ -4,9 +4,15 @@
 #
 import codecs
 from collections import deque
+try:
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+except ImportError:  # pragma: no cover
+    ProcessPoolExecutor = as_completed = None
 import contextlib
 import csv
+import errno
 from glob import iglob as std_iglob
+import hashlib
 import io
 import json
 import logging
@@ -588,25 +594,91 @@ class FileOperator(object):
             if self.record:
                 self.dirs_created.add(path)
 
-    def byte_compile(self, path, optimize=False, force=False, prefix=None, hashed_invalidation=False):
+    def _byte_compile_target(self, path, optimize, force, prefix):
+        """
+        Work out where a file should be byte-compiled to, and whether that
+        needs doing. Returns a tuple of the compiled file's path, whether it
+        is out of date (always false in a dry run), and the path to use in
+        error messages.
+        """
         dpath = cache_from_source(path, not optimize)
+        stale = not self.dry_run and (force or self.newer(path, dpath))
+        if not prefix:
+            diagpath = None
+        else:
+            assert path.startswith(prefix)
+            diagpath = path[len(prefix):]
+        return dpath, stale, diagpath
+
+    def byte_compile(self, path, optimize=False, force=False, prefix=None, hashed_invalidation=False):
+        dpath, stale, diagpath = self._byte_compile_target(path, optimize, force, prefix)
         logger.info('Byte-compiling %s to %s', path, dpath)
-        if not self.dry_run:
-            if force or self.newer(path, dpath):
-                if not prefix:
-                    diagpath = None
-                else:
-                    assert path.startswith(prefix)
-                    diagpath = path[len(prefix):]
-            compile_kwargs = {}
-            if hashed_invalidation and hasattr(py_compile, 'PycInvalidationMode'):
-                if not isinstance(hashed_invalidation, py_compile.PycInvalidationMode):
-                    hashed_invalidation = py_compile.PycInvalidationMode.CHECKED_HASH
-                compile_kwargs['invalidation_mode'] = hashed_invalidation
+        if stale:
+            compile_kwargs = _get_compile_kwargs(hashed_invalidation)
             py_compile.compile(path, dpath, diagpath, True, **compile_kwargs)  # raise error
         self.record_as_written(dpath)
         return dpath
 
+    def byte_compile_many(self, paths, optimize=False, force=False, prefix=None, hashed_invalidation=False,
+                          workers=None):
+        """
+        Byte-compile a number of files, using a pool of worker processes if
+        there are enough out-of-date files to make that worthwhile.
+
+        The arguments are as for :meth:`byte_compile`, except that ``workers``
+        is the maximum number of worker processes to use (by default, the
+        number of CPUs). A list of the compiled files, in the same order as
+        ``paths``, is returned. If any file fails to compile,
+        :class:`py_compile.PyCompileError` is raised once all the others
+        have been compiled (and recorded).
+        """
+        if workers is None:
+            workers = _cpu_count()
+        result = []
+        jobs = []
+        for path in paths:
+            dpath, stale, diagpath = self._byte_compile_target(path, optimize, force, prefix)
+            result.append(dpath)
+            if stale:
+                jobs.append((path, dpath, diagpath))
+            else:
+                self.record_as_written(dpath)
+        compile_kwargs = _get_compile_kwargs(hashed_invalidation)
+        error = None
+        if workers < 2 or len(jobs) < _MIN_PARALLEL_COMPILES or ProcessPoolExecutor is None:
+            for path, dpath, diagpath in jobs:
+                logger.info('Byte-compiling %s to %s', path, dpath)
+                try:
+                    py_compile.compile(path, dpath, diagpath, True, **compile_kwargs)
+                except py_compile.PyCompileError as e:
+                    if error is None:
+                        error = e
+                else:
+                    self.record_as_written(dpath)
+        else:
+            logger.info('Byte-compiling %d files using up to %d processes', len(jobs), workers)
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+                futures = dict((executor.submit(_compile_file, job, compile_kwargs), job) for job in jobs)
+                for f in as_completed(futures):
+                    path, dpath, _ = futures[f]
+                    try:
+                        failure = f.result()
+                    except Exception as e:
+                        # e.g. a missing source file: keep going, so that the
+                        # files the other workers compile are still recorded
+                        if error is None:
+                            error = e
+                        continue
+                    if failure is None:
+                        self.record_as_written(dpath)
+                    elif error is None:
+                        exc_type_name, exc_value, msg = failure
+                        error = py_compile.PyCompileError(Exception, exc_value, path, msg)
+                        error.exc_type_name = exc_type_name
+        if error:
+            raise error
+        return result
+
     def ensure_removed(self, path):
         if os.path.exists(path):
             if os.path.isdir(path) and not os.path.islink(path):
@@ -652,23 +724,67 @@ class FileOperator(object):
 
     def rollback(self):
         if not self.dry_run:
+            # Just try each removal, rather than checking for existence (and
+            # so making an extra system call) first
             for f in list(self.files_written):
-                if os.path.exists(f):
+                try:
                     os.remove(f)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
             # dirs should all be empty now, except perhaps for
             # __pycache__ subdirs
             # reverse so that subdirs appear before their parents
             dirs = sorted(self.dirs_created, reverse=True)
             for d in dirs:
-                flist = os.listdir(d)
-                if flist:
+                try:
+                    os.rmdir(d)
+                except OSError:
+                    flist = os.listdir(d)
+                    if not flist:
+                        raise
                     assert flist == ['__pycache__']
                     sd = os.path.join(d, flist[0])
                     os.rmdir(sd)
-                os.rmdir(d)  # should fail if non-empty
+                    os.rmdir(d)  # should fail if non-empty
         self._init_record()
 
 
+# Below this number of files, byte_compile_many() doesn't bother with worker
+# processes, as starting them would cost more than it saves.
+_MIN_PARALLEL_COMPILES = 16
+
+
+def _cpu_count():
+    try:
+        result = os.cpu_count()
+    except AttributeError:  # pragma: no cover
+        import multiprocessing
+        result = multiprocessing.cpu_count()
+    return result or 1
+
+
+def _get_compile_kwargs(hashed_invalidation):
+    result = {}
+    if hashed_invalidation and hasattr(py_compile, 'PycInvalidationMode'):
+        if not isinstance(hashed_invalidation, py_compile.PycInvalidationMode):
+            hashed_invalidation = py_compile.PycInvalidationMode.CHECKED_HASH
+        result['invalidation_mode'] = hashed_invalidation
+    return result
+
+
+def _compile_file(job, compile_kwargs):
+    # Runs in a worker process for FileOperator.byte_compile_many(). A
+    # PyCompileError can't be sent back to the parent process (it can't be
+    # unpickled), so the details are returned instead; None means success.
+    path, dpath, diagpath = job
+    try:
+        py_compile.compile(path, dpath, diagpath, True, **compile_kwargs)
+    except py_compile.PyCompileError as e:
+        return e.exc_type_name, str(e.exc_value), e.msg
+    return None
+
+
 def resolve(module_name, dotted_path):
     if module_name in sys.modules:
         mod = sys.modules[module_name]
@@ -685,16 +801,37 @@ def resolve(module_name, dotted_path):
 
 
 class ExportEntry(object):
+    # There can be a lot of these, so avoid a per-instance __dict__
+    __slots__ = ('name', 'prefix', 'suffix', 'flags', 'dist', '_value')
 
     def __init__(self, name, prefix, suffix, flags):
         self.name = name
         self.prefix = prefix
         self.suffix = suffix
         self.flags = flags
+        self.dist = None
+
+    # Needed for pickling with protocols 0 and 1, because of __slots__. The
+    # resolved value isn't pickled, as it's often a module or function.
+    def __getstate__(self):
+        return dict((k, getattr(self, k)) for k in ('name', 'prefix', 'suffix', 'flags', 'dist') if hasattr(self, k))
 
-    @cached_property
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+    @property
     def value(self):
-        return resolve(self.prefix, self.suffix)
+        # cached_property can't be used, as it needs a __dict__
+        try:
+            result = self._value
+        except AttributeError:
+            result = self._value = resolve(self.prefix, self.suffix)
+        return result
+
+    @value.setter
+    def value(self, value):
+        self._value = value
 
     def __repr__(self):  # pragma: no cover
         return '<ExportEntry %s = %s:%s %s>' % (self.name, self.prefix, self.suffix, self.flags)
@@ -715,9 +852,20 @@ ENTRY_RE = re.compile(
                       \s*=\s*(?P<callable>(\w+)([:\.]\w+)*)
                       \s*(\[\s*(?P<flags>[\w-]+(=\w+)?(,\s*\w+(=\w+)?)*)\s*\])?
                       ''', re.VERBOSE)
+_ENTRY_FLAGS_SEP = re.compile(r',\s*')
 
 
-def get_export_entry(specification):
+# Parsed export entries, keyed by specification. The same specifications
+# (e.g. console_scripts entries) tend to be parsed over and over again.
+_export_entry_cache = {}
+_EXPORT_ENTRY_CACHE_SIZE = 4096
+
+
+def _parse_export_entry(specification):
+    """
+    Parse an export entry specification, returning a tuple of name, prefix,
+    suffix and flags (as a tuple), or None if it's not a specification.
+    """
     m = ENTRY_RE.search(specification)
     if not m:
         result = None
@@ -741,10 +889,29 @@ def get_export_entry(specification):
             if '[' in specification or ']' in specification:
                 raise DistlibException("Invalid specification "
                                        "'%s'" % specification)
-            flags = []
+            flags = ()
         else:
-            flags = [f.strip() for f in flags.split(',')]
-        result = ExportEntry(name, prefix, suffix, flags)
+            # ENTRY_RE has already validated the flags, so splitting on the
+            # separator is enough - no per-flag stripping is needed
+            flags = tuple(_ENTRY_FLAGS_SEP.split(flags))
+        result = name, prefix, suffix, flags
+    return result
+
+
+def get_export_entry(specification):
+    try:
+        parsed = _export_entry_cache[specification]
+    except KeyError:
+        parsed = _parse_export_entry(specification)
+        if len(_export_entry_cache) >= _EXPORT_ENTRY_CACHE_SIZE:
+            _export_entry_cache.clear()
+        _export_entry_cache[specification] = parsed
+    if parsed is None:
+        result = None
+    else:
+        # A new instance each time, as callers may mutate what they get
+        name, prefix, suffix, flags = parsed
+        result = ExportEntry(name, prefix, suffix, list(flags))
     return result
 
 
@@ -765,6 +932,18 @@ def get_cache_base(suffix=None):
     """
     if suffix is None:
         suffix = '.distlib'
+    result, usable = _get_cache_parent()
+    if not usable:
+        result = tempfile.mkdtemp()
+        logger.warning('Default location unusable, using %s', result)
+    return os.path.join(result, suffix)
+
+
+def _get_cache_parent():
+    """
+    Return the parent directory for the default cache base (see
+    :func:`get_cache_base`) and whether it's usable.
+    """
     if os.name == 'nt' and 'LOCALAPPDATA' in os.environ:
         result = os.path.expandvars('$localappdata')
     else:
@@ -783,10 +962,7 @@ def get_cache_base(suffix=None):
         except OSError:
             logger.warning('Unable to create %s', result, exc_info=True)
             usable = False
-    if not usable:
-        result = tempfile.mkdtemp()
-        logger.warning('Default location unusable, using %s', result)
-    return os.path.join(result, suffix)
+    return result, usable
 
 
 def path_to_cache_dir(path):
@@ -800,6 +976,9 @@ def path_to_cache_dir(path):
     #. ``'.cache'`` is appended.
     """
     d, p = os.path.splitdrive(os.path.abspath(path))
+    # Each part needs only one substitution, and str.replace() does it in a
+    # single pass - str.translate() with a multi-character replacement is
+    # much slower (it has to go through a dict lookup for every character).
     if d:
         d = d.replace(':', '---')
     p = p.replace(os.sep, '--')
@@ -814,12 +993,11 @@ def ensure_slash(s):
 
 def parse_credentials(netloc):
     username = password = None
-    if '@' in netloc:
-        prefix, netloc = netloc.rsplit('@', 1)
-        if ':' not in prefix:
-            username = prefix
-        else:
-            username, password = prefix.split(':', 1)
+    prefix, sep, netloc = netloc.rpartition('@')
+    if sep:
+        username, sep, password = prefix.partition(':')
+        if not sep:
+            password = None
     if username:
         username = unquote(username)
     if password:
@@ -954,10 +1132,92 @@ def get_project_data(name):
     return result
 
 
+# How long (in seconds) package data fetched by get_package_data() is kept in
+# the on-disk cache before being fetched again
+PACKAGE_DATA_CACHE_TTL = 24 * 60 * 60
+
+# Where that cache is kept. This is worked out on first use (as
+# 'package-data-cache' in the default cache base - see get_cache_base()), and
+# is False if that location can't be used, in which case nothing is cached.
+_package_data_cache_dir = None
+
+
+def _get_package_data_cache_dir():
+    global _package_data_cache_dir
+
+    if _package_data_cache_dir is None:
+        # Not get_cache_base(), as that falls back to a new temporary
+        # directory if the default location is unusable
+        parent, usable = _get_cache_parent()
+        result = False
+        if usable:
+            d = os.path.join(parent, '.distlib', 'package-data-cache')
+            try:
+                if not os.path.isdir(d):
+                    os.makedirs(d)
+                result = d
+            except OSError:
+                logger.warning('Unable to create %s', d, exc_info=True)
+        if not result:
+            logger.warning('Package data will not be cached')
+        _package_data_cache_dir = result
+    return _package_data_cache_dir
+
+
+def _read_cached_package_data(path):
+    result = None
+    try:
+        if time.time() - os.stat(path).st_mtime < PACKAGE_DATA_CACHE_TTL:
+            with codecs.open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+    except (OSError, IOError, ValueError):
+        pass
+    return result
+
+
+def _write_cached_package_data(path, data):
+    d = os.path.dirname(path)
+    try:
+        if not os.path.isdir(d):
+            os.makedirs(d)
+        # Write to a temporary file and then rename it into place, so that
+        # concurrent readers never see a partially written file
+        fd, tmp = tempfile.mkstemp(dir=d, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(data).encode('utf-8'))
+            if hasattr(os, 'replace'):
+                os.replace(tmp, path)
+            else:  # pragma: no cover
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(tmp, path)
+        except Exception:
+            os.remove(tmp)
+            raise
+    except Exception as e:
+        logger.debug('Unable to cache package data in %s: %s', path, e)
+
+
 def get_package_data(name, version):
+    """
+    Get the extended metadata for a specific version of a project. Results are
+    cached on disk for :data:`PACKAGE_DATA_CACHE_TTL` seconds; failed fetches
+    aren't cached.
+    """
     url = '%s/%s/package-%s.json' % (name[0].upper(), name, version)
     url = urljoin(_external_data_base_url, url)
-    return _get_external_data(url)
+    path = result = None
+    cache_dir = _get_package_data_cache_dir()
+    if cache_dir:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        path = os.path.join(cache_dir, key + '.json')
+        result = _read_cached_package_data(path)
+    if result is None:
+        result = _get_external_data(url)
+        if result and path:
+            _write_cached_package_data(path, result)
+    return result
 
 
 class Cache(object):
@@ -1011,6 +1271,10 @@ class EventMixin(object):
 
     def __init__(self):
         self._subscribers = {}
+        # Per-thread queue of events published by subscribers during a
+        # publish() on that thread; its 'pending' attribute is None when the
+        # thread isn't publishing
+        self._publishing = threading.local()
 
     def add(self, event, subscriber, append=True):
         """
@@ -1022,15 +1286,14 @@ class EventMixin(object):
         :param append: Whether to append or prepend the subscriber to an
                        existing subscriber list for the event.
         """
+        # Subscribers are held in tuples, which are cheap to iterate over and
+        # can't be changed under a publish() which is iterating over them
         subs = self._subscribers
-        if event not in subs:
-            subs[event] = deque([subscriber])
+        existing = subs.get(event, ())
+        if append:
+            subs[event] = existing + (subscriber, )
         else:
-            sq = subs[event]
-            if append:
-                sq.append(subscriber)
-            else:
-                sq.appendleft(subscriber)
+            subs[event] = (subscriber, ) + existing
 
     def remove(self, event, subscriber):
         """
@@ -1042,7 +1305,9 @@ class EventMixin(object):
         subs = self._subscribers
         if event not in subs:
             raise ValueError('No subscribers: %r' % event)
-        subs[event].remove(subscriber)
+        sq = list(subs[event])
+        sq.remove(subscriber)
+        subs[event] = tuple(sq)
 
     def get_subscribers(self, event):
         """
@@ -1056,14 +1321,34 @@ class EventMixin(object):
         Publish a event and return a list of values returned by its
         subscribers.
 
+        If this is called by a subscriber while an event is being published
+        on the same thread, the new event is queued and published (in order)
+        once the current one has been dispatched, rather than recursively. In
+        that case, an empty list is returned.
+
         :param event: The event to publish.
         :param args: The positional arguments to pass to the event's
                      subscribers.
         :param kwargs: The keyword arguments to pass to the event's
                        subscribers.
         """
+        state = self._publishing
+        pending = getattr(state, 'pending', None)
+        if pending is not None:
+            pending.append((event, args, kwargs))
+            return []
+        state.pending = pending = deque()
+        try:
+            result = self._dispatch(event, args, kwargs)
+            while pending:
+                self._dispatch(*pending.popleft())
+        finally:
+            state.pending = None
+        return result
+
+    def _dispatch(self, event, args, kwargs):
         result = []
-        for subscriber in self.get_subscribers(event):
+        for subscriber in self._subscribers.get(event, ()):
             try:
                 value = subscriber(event, *args, **kwargs)
             except Exception:
@@ -1083,11 +1368,14 @@ class Sequencer(object):
         self._preds = {}
         self._succs = {}
         self._nodes = set()  # nodes with no preds/succs
+        self._steps_cache = {}  # final step -> steps, cleared on any change
 
     def add_node(self, node):
+        self._steps_cache.clear()
         self._nodes.add(node)
 
     def remove_node(self, node, edges=False):
+        self._steps_cache.clear()
         if node in self._nodes:
             self._nodes.remove(node)
         if edges:
@@ -1105,11 +1393,13 @@ class Sequencer(object):
 
     def add(self, pred, succ):
         assert pred != succ
+        self._steps_cache.clear()
         self._preds.setdefault(succ, set()).add(pred)
         self._succs.setdefault(pred, set()).add(succ)
 
     def remove(self, pred, succ):
         assert pred != succ
+        self._steps_cache.clear()
         try:
             preds = self._preds[succ]
             succs = self._succs[pred]
@@ -1125,6 +1415,8 @@ class Sequencer(object):
         return (step in self._preds or step in self._succs or step in self._nodes)
 
     def get_steps(self, final):
+        if final in self._steps_cache:
+            return iter(self._steps_cache[final])
         if not self.is_step(final):
             raise ValueError('Unknown: %r' % final)
         result = []
@@ -1147,57 +1439,72 @@ class Sequencer(object):
                 result.append(step)
                 preds = self._preds.get(step, ())
                 todo.extend(preds)
-        return reversed(result)
+        result = tuple(reversed(result))
+        self._steps_cache[final] = result
+        return iter(result)
 
     @property
     def strong_connections(self):
         # http://en.wikipedia.org/wiki/Tarjan%27s_strongly_connected_components_algorithm
-        index_counter = [0]
+        # This is an iterative version, using an explicit stack of
+        # (node, successor iterator) pairs instead of recursing for each
+        # node, so that large graphs can't hit the recursion limit.
+        # A compressed sparse row (array-based) copy of the graph was tried
+        # here, but it has to be rebuilt after every change to the graph, and
+        # as this is usually read just once per graph, the build cost made it
+        # slower overall than working on the dicts directly.
+        index_counter = 0
         stack = []
+        on_stack = set()
         lowlinks = {}
         index = {}
         result = []
 
         graph = self._succs
 
-        def strongconnect(node):
-            # set the depth index for this node to the smallest unused index
-            index[node] = index_counter[0]
-            lowlinks[node] = index_counter[0]
-            index_counter[0] += 1
-            stack.append(node)
-
-            # Consider successors
-            try:
-                successors = graph[node]
-            except Exception:
-                successors = []
-            for successor in successors:
-                if successor not in lowlinks:
-                    # Successor has not yet been visited
-                    strongconnect(successor)
-                    lowlinks[node] = min(lowlinks[node], lowlinks[successor])
-                elif successor in stack:
-                    # the successor is in the stack and hence in the current
-                    # strongly connected component (SCC)
-                    lowlinks[node] = min(lowlinks[node], index[successor])
-
-            # If `node` is a root node, pop the stack and generate an SCC
-            if lowlinks[node] == index[node]:
-                connected_component = []
-
-                while True:
-                    successor = stack.pop()
-                    connected_component.append(successor)
-                    if successor == node:
+        for root in graph:
+            if root in lowlinks:
+                continue
+            index[root] = lowlinks[root] = index_counter
+            index_counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(graph.get(root, ())))]
+            while work:
+                node, successors = work[-1]
+                for successor in successors:
+                    if successor not in lowlinks:
+                        # Successor has not yet been visited: visit it, then
+                        # come back to the rest of this node's successors
+                        index[successor] = lowlinks[successor] = index_counter
+                        index_counter += 1
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(graph.get(successor, ()))))
                         break
-                component = tuple(connected_component)
-                # storing the result
-                result.append(component)
-
-        for node in graph:
-            if node not in lowlinks:
-                strongconnect(node)
+                    elif successor in on_stack:
+                        # the successor is in the stack and hence in the current
+                        # strongly connected component (SCC)
+                        lowlinks[node] = min(lowlinks[node], index[successor])
+                else:
+                    # All successors done
+                    work.pop()
+                    # If `node` is a root node, pop the stack and generate an SCC
+                    if lowlinks[node] == index[node]:
+                        connected_component = []
+
+                        while True:
+                            successor = stack.pop()
+                            on_stack.remove(successor)
+                            connected_component.append(successor)
+                            if successor == node:
+                                break
+                        component = tuple(connected_component)
+                        # storing the result
+                        result.append(component)
+                    if work:
+                        parent = work[-1][0]
+                        lowlinks[parent] = min(lowlinks[parent], lowlinks[node])
 
         return result
 
@@ -1220,8 +1527,30 @@ class Sequencer(object):
 
 ARCHIVE_EXTENSIONS = ('.tar.gz', '.tar.bz2', '.tar', '.zip', '.tgz', '.tbz', '.whl')
 
+# Archive format for each extension handled by unarchive(), and the mode to
+# open each format's archives with
+_ARCHIVE_SUFFIX_FORMATS = {
+    '.zip': 'zip',
+    '.whl': 'zip',
+    '.tar.gz': 'tgz',
+    '.tgz': 'tgz',
+    '.tar.bz2': 'tbz',
+    '.tbz': 'tbz',
+    '.tar': 'tar',
+}
+_ARCHIVE_FORMAT_MODES = {
+    'zip': 'r',
+    'tgz': 'r:gz',
+    'tbz': 'r:bz2',
+    'tar': 'r',
+}
+
 
 def unarchive(archive_filename, dest_dir, format=None, check=True):
+    """
+    Extract an archive into a directory, returning the names of the archive's
+    members (so that callers needn't open the archive again to find them).
+    """
 
     def check_path(path):
         if not isinstance(path, text_type):
@@ -1234,32 +1563,25 @@ def unarchive(archive_filename, dest_dir, format=None, check=True):
     plen = len(dest_dir)
     archive = None
     if format is None:
-        if archive_filename.endswith(('.zip', '.whl')):
-            format = 'zip'
-        elif archive_filename.endswith(('.tar.gz', '.tgz')):
-            format = 'tgz'
-            mode = 'r:gz'
-        elif archive_filename.endswith(('.tar.bz2', '.tbz')):
-            format = 'tbz'
-            mode = 'r:bz2'
-        elif archive_filename.endswith('.tar'):
-            format = 'tar'
-            mode = 'r'
-        else:  # pragma: no cover
+        root, ext = os.path.splitext(archive_filename)
+        if ext in ('.gz', '.bz2'):
+            ext = os.path.splitext(root)[1] + ext
+        format = _ARCHIVE_SUFFIX_FORMATS.get(ext)
+        if format is None:
             raise ValueError('Unknown format for %r' % archive_filename)
+    mode = _ARCHIVE_FORMAT_MODES.get(format)
+    if mode is None:
+        raise ValueError('Unknown archive format: %r' % format)
     try:
         if format == 'zip':
-            archive = ZipFile(archive_filename, 'r')
-            if check:
-                names = archive.namelist()
-                for name in names:
-                    check_path(name)
+            archive = ZipFile(archive_filename, mode)
+            names = archive.namelist()
         else:
             archive = tarfile.open(archive_filename, mode)
-            if check:
-                names = archive.getnames()
-                for name in names:
-                    check_path(name)
+            names = archive.getnames()
+        if check:
+            for name in names:
+                check_path(name)
         if format != 'zip' and sys.version_info[0] < 3:
             # See Python issue 17153. If the dest path contains Unicode,
             # tarfile extraction fails on Python 2.x if a member path name
@@ -1283,7 +1605,7 @@ def unarchive(archive_filename, dest_dir, format=None, check=True):
         archive.extraction_filter = extraction_filter
 
         archive.extractall(dest_dir)
-
+        return names
     finally:
         if archive:
             archive.close()
@@ -1313,23 +1635,49 @@ UNITS = ('', 'K', 'M', 'G', 'T', 'P')
 class Progress(object):
     unknown = 'UNKNOWN'
 
-    def __init__(self, minval=0, maxval=100):
+    def __init__(self, minval=0, maxval=100, smoothing=None):
+        """
+        Initialise an instance.
+
+        :param minval: The starting value.
+        :param maxval: The final value, or None if not known.
+        :param smoothing: If None, the speed shown is the average over the
+                          whole run. Otherwise, it's an exponentially weighted
+                          moving average of the speed between updates, and
+                          this is the weight (> 0 and <= 1) given to the
+                          latest of those.
+        """
         assert maxval is None or maxval >= minval
+        assert smoothing is None or 0 < smoothing <= 1
         self.min = self.cur = minval
         self.max = maxval
         self.started = None
         self.elapsed = 0
         self.done = False
+        self.smoothing = smoothing
+        self._rate = None
+        self._last = None
+        self._time = time.time  # can be replaced, e.g. for testing
 
     def update(self, curval):
         assert self.min <= curval
         assert self.max is None or curval <= self.max
         self.cur = curval
-        now = time.time()
+        now = self._time()
         if self.started is None:
             self.started = now
+            self._last = now, curval
         else:
             self.elapsed = now - self.started
+            if self.smoothing is not None:
+                last_time, last_value = self._last
+                dt = now - last_time
+                if dt > 0:
+                    rate = (curval - last_value) / dt
+                    if self._rate is not None:
+                        rate = self.smoothing * rate + (1 - self.smoothing) * self._rate
+                    self._rate = rate
+                    self._last = now, curval
 
     def increment(self, incr):
         assert incr >= 0
@@ -1389,7 +1737,9 @@ class Progress(object):
 
     @property
     def speed(self):
-        if self.elapsed == 0:
+        if self._rate is not None:
+            result = self._rate
+        elif self.elapsed == 0:
             result = 0.0
         else:
             result = (self.cur - self.min) / self.elapsed
@@ -16,10 +16,10 @@ except ImportError:
 import sys
 import tempfile
 import textwrap
-import time
+import threading
 
 from compat import unittest
-from support import TempdirManager, DistlibTestCase, in_github_workflow
+from support import TempdirManager, DistlibTestCase
 
 from distlib import DistlibException
 from distlib.compat import cache_from_source
@@ -29,7 +29,13 @@ from distlib.util import (get_export_entry, ExportEntry, resolve, get_cache_base
                           FileOperator, is_string_sequence, get_package_data, convert_path)
 
 HERE = os.path.dirname(os.path.abspath(__file__))
-IN_GITHUB_WORKFLOW = in_github_workflow()
+
+# Where available, use a RAM-backed filesystem for scratch directories in
+# tests which do lots of small file operations
+if os.name == 'posix' and os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+    FAST_TEMPDIR = '/dev/shm'
+else:
+    FAST_TEMPDIR = None
 
 
 class TestContainer(object):
@@ -77,6 +83,37 @@ class UtilTestCase(DistlibTestCase):
         self.assertRaises(DistlibException, get_export_entry, 'foo=foo.bar:x [a,]')
         self.assertRaises(DistlibException, get_export_entry, 'foo=foo.bar:x [a,,b]')
         self.assertRaises(DistlibException, get_export_entry, 'foo=foo.bar:x [a b]')
+        # Results are cached, but each call must return a fresh instance
+        e1 = get_export_entry('foo=foo.bar:main [a]')
+        e1.flags.append('b')
+        e2 = get_export_entry('foo=foo.bar:main [a]')
+        self.assertIsNot(e1, e2)
+        self.check_entry(e2, 'foo', 'foo.bar', 'main', ['a'])
+
+    def test_export_entry_value(self):
+        import logging
+
+        e = ExportEntry('foo', 'logging', 'root', [])
+        self.assertFalse(hasattr(e, '__dict__'))
+        self.assertIs(e.value, logging.root)
+        e.prefix = 'os'
+        self.assertIs(e.value, logging.root)  # cached
+        e = get_export_entry('foo = logging.handlers')
+        self.assertEqual(e.value.__name__, 'logging.handlers')
+        self.assertIsNone(e.dist)
+        e.dist = d = TestContainer('dist')
+        self.assertIs(e.dist, d)
+
+    def test_export_entry_pickle(self):
+        import pickle
+
+        e = get_export_entry('foo = logging:root [a, b]')
+        e.value  # resolved values aren't pickled
+        for proto in range(pickle.HIGHEST_PROTOCOL + 1):
+            e2 = pickle.loads(pickle.dumps(e, proto))
+            self.assertEqual(e2, e)
+            self.check_entry(e2, 'foo', 'logging', 'root', ['a', 'b'])
+            self.assertIsNone(e2.dist)
 
     def test_resolve(self):
         import logging
@@ -235,6 +272,57 @@ class UtilTestCase(DistlibTestCase):
         for actual, expected in zip(actuals, cases):
             self.assertEqual(actual, expected)
 
+        # Events published by subscribers are queued rather than recursed into
+        order = []
+
+        def handler4(event, n):
+            order.append(n)
+            if n < 3:
+                self.assertEqual(e.publish(event, n + 1), [])
+                order.append(-n)
+            return n
+
+        e = EventMixin()
+        e.add('D', handler4)
+        self.assertEqual(e.publish('D', 1), [1])
+        self.assertEqual(order, [1, -1, 2, -2, 3])
+
+        # ... but only when published on the same thread
+        started = threading.Event()
+        done = threading.Event()
+        results = {}
+
+        def handler6(event, name):
+            if name == 'main':
+                started.set()
+                done.wait(5)
+            return name
+
+        def publish_from_thread():
+            started.wait(5)
+            results['t'] = e.publish('F', 't')
+            done.set()
+
+        e = EventMixin()
+        e.add('F', handler6)
+        t = threading.Thread(target=publish_from_thread)
+        t.start()
+        results['main'] = e.publish('F', 'main')
+        t.join()
+        self.assertEqual(results, {'main': ['main'], 't': ['t']})
+
+        # Subscribers can be changed while an event is being published
+        def handler5(event):
+            e.remove(event, handler5)
+            e.add(event, handler1, append=False)
+            return 5
+
+        e = EventMixin()
+        e.add('E', handler5)
+        e.add('E', handler2)
+        self.assertEqual(e.publish('E'), [5, None])
+        self.assertEqual(tuple(e.get_subscribers('E')), (handler1, handler2))
+
     def test_sequencer_basic(self):
         seq = Sequencer()
 
@@ -373,6 +461,17 @@ class UtilTestCase(DistlibTestCase):
         seq.remove('C', 'A')
         self.assertEqual(list(seq.get_steps('D')), ['A', 'B', 'C', 'D'])
 
+    def test_sequencer_deep(self):
+        # strong_connections shouldn't recurse per node
+        seq = Sequencer()
+        n = sys.getrecursionlimit() * 2
+        for i in range(n):
+            seq.add(i, i + 1)
+        self.assertEqual(len(seq.strong_connections), n + 1)
+        seq.add(n, 0)
+        self.assertEqual(len(seq.strong_connections), 1)
+        self.assertEqual(set(seq.strong_connections[0]), set(range(n + 1)))
+
     def test_sequencer_removal(self):
         seq = Sequencer()
         seq.add('A', 'B')
@@ -390,35 +489,42 @@ class UtilTestCase(DistlibTestCase):
         self.assertEqual(seq._succs, {'A': set(['B'])})
 
     def test_unarchive(self):
-        import zipfile, tarfile
+        import tarfile
 
-        good_archives = (
-            ('good.zip', zipfile.ZipFile, 'r', 'namelist'),
-            ('good.tar', tarfile.open, 'r', 'getnames'),
-            ('good.tar.gz', tarfile.open, 'r:gz', 'getnames'),
-            ('good.tar.bz2', tarfile.open, 'r:bz2', 'getnames'),
-        )
+        good_archives = ('good.zip', 'good.tar', 'good.tar.gz', 'good.tar.bz2')
         bad_archives = ('bad.zip', 'bad.tar', 'bad.tar.gz', 'bad.tar.bz2')
 
         # Test "evil" tarball on 3.12 *or* on Python with PEP-706 backported
         if sys.version_info > (3, 12) or hasattr(tarfile, 'data_filter'):
             bad_archives += ('evil.tar.gz', )
 
-        for name, cls, mode, lister in good_archives:
+        for name in good_archives:
             td = tempfile.mkdtemp()
-            archive = None
             try:
                 name = os.path.join(HERE, name)
-                unarchive(name, td)
-                archive = cls(name, mode)
-                names = getattr(archive, lister)()
+                names = unarchive(name, td)
+                self.assertTrue(names)
                 for name in names:
                     p = os.path.join(td, name)
                     self.assertTrue(os.path.exists(p))
             finally:
                 shutil.rmtree(td)
-                if archive:
-                    archive.close()
+
+        # Explicitly specified formats
+        for name, format in (('good.tar.gz', 'tgz'), ('good.tar.bz2', 'tbz'), ('good.tar', 'tar')):
+            td = tempfile.mkdtemp()
+            try:
+                names = unarchive(os.path.join(HERE, name), td, format=format)
+                self.assertTrue(names)
+            finally:
+                shutil.rmtree(td)
+
+        td = tempfile.mkdtemp()
+        try:
+            self.assertRaises(ValueError, unarchive, os.path.join(HERE, 'good.tar'), td, format='rar')
+            self.assertRaises(ValueError, unarchive, os.path.join(HERE, 'good.bin'), td)
+        finally:
+            shutil.rmtree(td)
 
         for name in bad_archives:
             name = os.path.join(HERE, name)
@@ -434,9 +540,20 @@ class UtilTestCase(DistlibTestCase):
         self.assertFalse(is_string_sequence(['a', 'b', None]))
         self.assertRaises(AssertionError, is_string_sequence, [])
 
+    def use_temp_package_data_cache(self):
+        # Keep the package data cache out of the user's real cache directory
+        import distlib.util
+
+        td = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, td)
+        self.addCleanup(setattr, distlib.util, '_package_data_cache_dir', distlib.util._package_data_cache_dir)
+        distlib.util._package_data_cache_dir = td
+        return td
+
     @unittest.skipIf('SKIP_ONLINE' in os.environ, 'Skipping online test')
     @unittest.skipUnless(ssl, 'SSL required for this test.')
     def test_package_data(self):
+        self.use_temp_package_data_cache()
         data = get_package_data(name='config', version='0.3.6')
         self.assertTrue(data)
         self.assertTrue('index-metadata' in data)
@@ -446,6 +563,91 @@ class UtilTestCase(DistlibTestCase):
         data = get_package_data(name='config', version='0.3.5')
         self.assertFalse(data)
 
+    def test_package_data_cache(self):
+        import distlib.util
+
+        td = self.use_temp_package_data_cache()
+        fetched = []
+        responses = {
+            'C/config/package-0.3.6.json': {'index-metadata': {'name': 'config', 'version': '0.3.6'}},
+        }
+
+        def fake_get_external_data(url):
+            fetched.append(url)
+            return responses.get(url[len(distlib.util._external_data_base_url):], {})
+
+        self.addCleanup(setattr, distlib.util, '_get_external_data', distlib.util._get_external_data)
+        distlib.util._get_external_data = fake_get_external_data
+
+        expected = responses['C/config/package-0.3.6.json']
+        # Miss: fetched, and written to the cache
+        self.assertEqual(get_package_data('config', '0.3.6'), expected)
+        self.assertEqual(len(fetched), 1)
+        files = os.listdir(td)
+        self.assertEqual(len(files), 1)
+        path = os.path.join(td, files[0])
+        # Hit: not fetched again
+        self.assertEqual(get_package_data('config', '0.3.6'), expected)
+        self.assertEqual(len(fetched), 1)
+        # Failed fetches aren't cached
+        self.assertEqual(get_package_data('config', '0.3.5'), {})
+        self.assertEqual(get_package_data('config', '0.3.5'), {})
+        self.assertEqual(len(fetched), 3)
+        self.assertEqual(os.listdir(td), files)
+        # Stale entries are fetched again, and the cache refreshed
+        t = os.stat(path).st_mtime - distlib.util.PACKAGE_DATA_CACHE_TTL - 1
+        os.utime(path, (t, t))
+        self.assertEqual(get_package_data('config', '0.3.6'), expected)
+        self.assertEqual(len(fetched), 4)
+        self.assertGreater(os.stat(path).st_mtime, t + 1)
+        self.assertEqual(get_package_data('config', '0.3.6'), expected)
+        self.assertEqual(len(fetched), 4)
+        # Data from a different index isn't served from the cache
+        self.addCleanup(setattr, distlib.util, '_external_data_base_url', distlib.util._external_data_base_url)
+        distlib.util._external_data_base_url = 'https://example.com/pypi/projects/'
+        self.assertEqual(get_package_data('config', '0.3.6'), expected)
+        self.assertEqual(len(fetched), 5)
+        self.assertEqual(len(os.listdir(td)), 2)
+        # Nothing is cached if the cache location is unusable
+        distlib.util._package_data_cache_dir = False
+        self.assertEqual(get_package_data('config', '0.3.6'), expected)
+        self.assertEqual(get_package_data('config', '0.3.6'), expected)
+        self.assertEqual(len(fetched), 7)
+        self.assertEqual(len(os.listdir(td)), 2)
+
+    def test_package_data_cache_dir(self):
+        import distlib.util
+
+        td = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, td)
+        self.addCleanup(setattr, distlib.util, '_package_data_cache_dir', distlib.util._package_data_cache_dir)
+        self.addCleanup(setattr, distlib.util, '_get_cache_parent', distlib.util._get_cache_parent)
+        calls = []
+
+        def fake_get_cache_parent():
+            calls.append(td)
+            return td, usable
+
+        distlib.util._get_cache_parent = fake_get_cache_parent
+        # Worked out once, and created
+        usable = True
+        distlib.util._package_data_cache_dir = None
+        expected = os.path.join(td, '.distlib', 'package-data-cache')
+        self.assertEqual(distlib.util._get_package_data_cache_dir(), expected)
+        self.assertEqual(distlib.util._get_package_data_cache_dir(), expected)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(os.path.isdir(expected))
+        # Unusable locations disable caching, without any temporary directory
+        # being created
+        os.rmdir(expected)
+        with open(expected, 'w') as f:
+            f.write('not a directory')
+        for usable in (True, False):
+            distlib.util._package_data_cache_dir = None
+            self.assertIs(distlib.util._get_package_data_cache_dir(), False)
+            self.assertIs(distlib.util._get_package_data_cache_dir(), False)
+        self.assertEqual(len(calls), 3)
+
     def test_zip_dir(self):
         d = os.path.join(HERE, 'foofoo')
         data = zip_dir(d)
@@ -519,95 +721,103 @@ class UtilTestCase(DistlibTestCase):
         self.assertEqual(cfg['e'], {'foo': 'bar', 'bar': 'baz'})
 
 
-def _speed_range(min_speed, max_speed):
-    return tuple(['%d KB/s' % v for v in range(min_speed, max_speed + 1)])
+class _Clock(object):
+    """
+    A clock which only moves when told to, for use as Progress._time.
+    """
 
+    def __init__(self):
+        self.now = 0.0
 
-def _eta_range(min_eta, max_eta, prefix='ETA '):
-    msg = prefix + ': 00:00:%02d'
-    return tuple([msg % v for v in range(min_eta, max_eta + 1)])
+    def __call__(self):
+        return self.now
 
 
 class ProgressTestCase(DistlibTestCase):
-    # Of late, the speed tests keep failing on AppVeyor and Windows
-    @unittest.skipIf(IN_GITHUB_WORKFLOW or (os.name == 'nt' and os.environ.get('APPVEYOR') == 'True'),
-                     'Test disabled on some environments due to performance')
-    def test_basic(self):
 
-        # These ranges may need tweaking to cater for especially slow
-        # machines
-        if os.name == 'nt':
-            speed1 = _speed_range(18, 20)
-            speed2 = _speed_range(20, 22)
-        else:
-            speed1 = _speed_range(16, 19)
-            speed2 = _speed_range(20, 22)
+    def test_basic(self):
         expected = (
-            (' 10 %', _eta_range(4, 7), speed1),
-            (' 20 %', _eta_range(4, 7), speed1),
-            (' 30 %', _eta_range(3, 4), speed1),
-            (' 40 %', _eta_range(3, 3), speed1),
-            (' 50 %', _eta_range(2, 2), speed1),
-            (' 60 %', _eta_range(2, 2), speed1),
-            (' 70 %', _eta_range(1, 1), speed1),
-            (' 80 %', _eta_range(1, 1), speed1),
-            (' 90 %', _eta_range(0, 0), speed1),
-            ('100 %', _eta_range(4, 5, 'Done'), speed2),
+            (' 10 %', 'ETA : 00:00:04', '20 KB/s'),
+            (' 20 %', 'ETA : 00:00:04', '20 KB/s'),
+            (' 30 %', 'ETA : 00:00:03', '20 KB/s'),
+            (' 40 %', 'ETA : 00:00:03', '20 KB/s'),
+            (' 50 %', 'ETA : 00:00:02', '20 KB/s'),
+            (' 60 %', 'ETA : 00:00:02', '20 KB/s'),
+            (' 70 %', 'ETA : 00:00:01', '20 KB/s'),
+            (' 80 %', 'ETA : 00:00:01', '20 KB/s'),
+            (' 90 %', 'ETA : 00:00:00', '20 KB/s'),
+            ('100 %', 'Done: 00:00:04', '22 KB/s'),
         )
-        bar = Progress(maxval=100000).start()
+        clock = _Clock()
+        bar = Progress(maxval=100000)
+        bar._time = clock
+        bar.start()
         for i, v in enumerate(range(10000, 100000, 10000)):
-            time.sleep(0.5)
+            clock.now += 0.5
             bar.update(v)
             p, e, s = expected[i]
             self.assertEqual(bar.percentage, p)
-            self.assertIn(bar.ETA, e, p)
-            self.assertIn(bar.speed, s)
+            self.assertEqual(bar.ETA, e, p)
+            self.assertEqual(bar.speed, s)
         bar.stop()
         p, e, s = expected[i + 1]
         self.assertEqual(bar.percentage, p)
-        self.assertIn(bar.ETA, e, p)
-        self.assertIn(bar.speed, s)
+        self.assertEqual(bar.ETA, e, p)
+        self.assertEqual(bar.speed, s)
 
-    # Of late, the speed tests keep failing on AppVeyor and Windows
-    @unittest.skipIf(IN_GITHUB_WORKFLOW or (os.name == 'nt' and os.environ.get('APPVEYOR') == 'True'),
-                     'Test disabled on some environments due to performance')
     def test_unknown(self):
-        if os.name == 'nt':
-            speed = _speed_range(17, 20)
-        else:
-            speed = _speed_range(17, 19)
         expected = (
-            (' ?? %', 'ETA : ??:??:??', speed),
-            (' ?? %', 'ETA : ??:??:??', speed),
-            (' ?? %', 'ETA : ??:??:??', speed),
-            (' ?? %', 'ETA : ??:??:??', speed),
-            (' ?? %', 'ETA : ??:??:??', speed),
-            (' ?? %', 'ETA : ??:??:??', speed),
-            (' ?? %', 'ETA : ??:??:??', speed),
-            (' ?? %', 'ETA : ??:??:??', speed),
-            (' ?? %', 'ETA : ??:??:??', speed),
-            ('100 %', 'Done: 00:00:04', speed),
+            (' ?? %', 'ETA : ??:??:??', '20 KB/s'),
+            (' ?? %', 'ETA : ??:??:??', '20 KB/s'),
+            (' ?? %', 'ETA : ??:??:??', '20 KB/s'),
+            (' ?? %', 'ETA : ??:??:??', '20 KB/s'),
+            (' ?? %', 'ETA : ??:??:??', '20 KB/s'),
+            (' ?? %', 'ETA : ??:??:??', '20 KB/s'),
+            (' ?? %', 'ETA : ??:??:??', '20 KB/s'),
+            (' ?? %', 'ETA : ??:??:??', '20 KB/s'),
+            (' ?? %', 'ETA : ??:??:??', '20 KB/s'),
+            ('100 %', 'Done: 00:00:04', '20 KB/s'),
         )
-        bar = Progress(maxval=None).start()
+        clock = _Clock()
+        bar = Progress(maxval=None)
+        bar._time = clock
+        bar.start()
         for i, v in enumerate(range(10000, 100000, 10000)):
-            time.sleep(0.5)
+            clock.now += 0.5
             bar.update(v)
             p, e, s = expected[i]
             self.assertEqual(bar.percentage, p)
             self.assertEqual(bar.ETA, e)
-            self.assertIn(bar.speed, s)
+            self.assertEqual(bar.speed, s)
         bar.stop()
         p, e, s = expected[i + 1]
         self.assertEqual(bar.percentage, p)
         self.assertEqual(bar.ETA, e)
-        self.assertIn(bar.speed, s)
+        self.assertEqual(bar.speed, s)
+
+    def test_smoothing(self):
+        clock = _Clock()
+        bar = Progress(maxval=100000, smoothing=0.5)
+        bar._time = clock
+        bar.start()
+        self.assertEqual(bar.speed, '0 B/s')
+        for v, expected in ((10000, '20 KB/s'), (20000, '20 KB/s'), (60000, '50 KB/s'), (70000, '35 KB/s')):
+            clock.now += 0.5
+            bar.update(v)
+            self.assertEqual(bar.speed, expected)
+        # No time has passed, so the speed can't be updated yet
+        bar.update(80000)
+        self.assertEqual(bar.speed, '35 KB/s')
+        clock.now += 0.5
+        bar.update(90000)
+        self.assertEqual(bar.speed, '37 KB/s')
 
 
 class FileOpsTestCase(DistlibTestCase):
 
     def setUp(self):
         self.fileop = FileOperator()
-        self.workdir = tempfile.mkdtemp()
+        self.workdir = tempfile.mkdtemp(dir=FAST_TEMPDIR)
 
     def tearDown(self):
         if os.path.isdir(self.workdir):
@@ -650,6 +860,72 @@ class FileOpsTestCase(DistlibTestCase):
         self.fileop.byte_compile(path, optimize=False)
         self.assertTrue(os.path.exists(dpath))
 
+    def write_modules(self, n, prefix='mod', subdir=''):
+        paths = []
+        for i in range(n):
+            path = os.path.join(self.workdir, subdir, '%s%d.py' % (prefix, i))
+            self.fileop.write_text_file(path, 'print("Hello, world %d!")' % i, 'utf-8')
+            paths.append(path)
+        return paths
+
+    def test_byte_compile_many(self):
+        for n in (2, 20):
+            paths = self.write_modules(n, 'hello%d_' % n)
+            dpaths = self.fileop.byte_compile_many(paths, optimize=False, workers=2)
+            self.assertEqual(dpaths, [cache_from_source(p, True) for p in paths])
+            for dpath in dpaths:
+                self.assertTrue(os.path.exists(dpath))
+
+    def test_byte_compile_many_up_to_date(self):
+        paths = self.write_modules(20)
+        # some files already compiled, so too few left to use workers
+        expected = [self.fileop.byte_compile(p) for p in paths[:7]]
+        mtimes = [os.stat(p).st_mtime for p in expected]
+        self.fileop.record = True
+        dpaths = self.fileop.byte_compile_many(paths, workers=4)
+        self.assertEqual(dpaths[:7], expected)
+        self.assertEqual([os.stat(p).st_mtime for p in expected], mtimes)
+        for dpath in dpaths:
+            self.assertTrue(os.path.exists(dpath))
+        # nothing to do
+        self.assertEqual(self.fileop.byte_compile_many(paths, workers=4), dpaths)
+        self.assertEqual(self.fileop.commit()[0], set(dpaths))
+
+    def test_byte_compile_many_error(self):
+        import py_compile
+
+        for n in (3, 20):
+            self.fileop.record = True
+            paths = self.write_modules(n, subdir='pkg%d' % n)
+            bad = paths[1]
+            with open(bad, 'w') as f:
+                f.write('def f(:\n')
+            with self.assertRaises(py_compile.PyCompileError) as ctx:
+                self.fileop.byte_compile_many(paths, workers=4)
+            self.assertEqual(ctx.exception.file, bad)
+            self.assertEqual(ctx.exception.exc_type_name, 'SyntaxError')
+            self.assertIn(bad, ctx.exception.msg)
+            # the other files are compiled and recorded, so can be rolled back
+            good = [cache_from_source(p, True) for p in paths if p != bad]
+            for dpath in good:
+                self.assertTrue(os.path.exists(dpath))
+            self.assertTrue(set(good) <= self.fileop.files_written)
+            self.fileop.rollback()
+            self.assertEqual(os.listdir(self.workdir), [])
+
+    def test_byte_compile_many_missing(self):
+        self.fileop.record = True
+        paths = self.write_modules(20, subdir='pkg')
+        missing = paths[0]
+        os.remove(missing)
+        self.assertRaises((IOError, OSError), self.fileop.byte_compile_many, paths, force=True, workers=4)
+        good = [cache_from_source(p, True) for p in paths if p != missing]
+        for dpath in good:
+            self.assertTrue(os.path.exists(dpath))
+        self.assertTrue(set(good) <= self.fileop.files_written)
+        self.fileop.rollback()
+        self.assertEqual(os.listdir(self.workdir), [])
+
     def write_some_files(self):
         path = os.path.join(self.workdir, 'file1')
         written = []
@@ -693,6 +969,18 @@ class FileOpsTestCase(DistlibTestCase):
         self.assertEqual(os.listdir(self.workdir), [])
         self.assertFalse(self.fileop.record)
 
+    def test_rollback_compiled(self):
+        self.fileop.record = True
+        d = os.path.join(self.workdir, 'pkg')
+        path = os.path.join(d, 'mod.py')
+        self.fileop.write_text_file(path, 'x = 1', 'utf-8')
+        self.fileop.byte_compile(path)
+        other = os.path.join(d, 'other.txt')
+        self.fileop.write_text_file(other, 'test', 'utf-8')
+        os.remove(other)  # already gone - rollback shouldn't mind
+        self.fileop.rollback()
+        self.assertEqual(os.listdir(self.workdir), [])
+
 
 class GlobTestCaseBase(TempdirManager, DistlibTestCase):
 